@@ -1,150 +1,409 @@
-from flask import Flask, render_template, request, session
+import gzip
+import hashlib
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from flask import Flask, abort, before_render_template, g, jsonify, redirect, render_template, request, session, template_rendered, url_for
 from peewee import Model, SqliteDatabase, CharField, IntegerField
-import pandas as pd
-import os
-import matplotlib.pyplot as plt
-import io
-import base64
 import numpy as np
+import os
+
+import charts
+import metrics
+import rounds
+from leaderboard import Leaderboard
+from catalog import Catalog, CatalogStore, source_stamp
+from sessions import ServerSideSessionInterface, make_store
+from upload import UploadError, iter_file_chunks, iter_lines, read_rows, write_csv
 
 app = Flask(__name__)
 app.secret_key = "your_secret_key"
+app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'memory')
+app.config['SESSION_DB'] = os.environ.get('SESSION_DB', 'sessions.db')
+app.config['SESSION_TTL'] = timedelta(hours=6)
+# Static assets are referenced with a content hash, so they can be cached for a year.
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = timedelta(days=365)
+app.config['CATALOG_SNAPSHOT_DIR'] = os.environ.get('CATALOG_SNAPSHOT_DIR', 'catalog_snapshot')
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED') == '1'
+metrics.registry.enabled = app.config['METRICS_ENABLED']
+# Outside Flask's request handling, so the timing includes the session save.
+app.wsgi_app = metrics.RequestTimer(app.wsgi_app, metrics.registry)
+app.session_interface = ServerSideSessionInterface(
+    make_store(app.config['SESSION_BACKEND'], app.config['SESSION_DB']),
+    ttl=app.config['SESSION_TTL'].total_seconds(),
+)
 
-db = SqliteDatabase('spotify_game.db')
+# WAL lets leaderboard reads carry on while the write-behind thread commits.
+db = SqliteDatabase('spotify_game.db', pragmas={'journal_mode': 'wal', 'synchronous': 'normal'})
 
 class PlayerScore(Model):
     name = CharField()
-    score = IntegerField()
+    score = IntegerField(index=True)
     class Meta:
         database = db
 
-db.connect()
-db.create_tables([PlayerScore])
+with db.connection_context():
+    db.create_tables([PlayerScore])
+
+leaderboard_cache = Leaderboard(PlayerScore, size=10)
 
 csv_file = "spotify_top500.csv"
-if os.path.exists(csv_file):
-    df = pd.read_csv(csv_file)
-    if df.empty:
-        df = pd.DataFrame(columns=["Artist", "MonthlyListeners"])
-else:
-    df = pd.DataFrame(columns=["Artist", "MonthlyListeners"])
-
-def get_random_artists():
-    if df.empty or len(df) < 2:
-        return [
-            {"Artist": "No Data Available", "MonthlyListeners": 0},
-            {"Artist": "Please Upload CSV", "MonthlyListeners": 0}
-        ]
-    return df.sample(2).to_dict(orient='records')
-
-def generate_chart(guessed_listeners, guessed_others, guessed_artists):
-    x = np.arange(len(guessed_listeners))
-    width = 0.35
-    fig, ax = plt.subplots(figsize=(16, 6), facecolor='#1e1e1e')
-    ax.set_facecolor('#1e1e1e')
-
-    bars_chosen = ax.bar(x - width / 2, guessed_listeners, width, label="Chosen Artist", color="#1E90FF")
-    bars_other = ax.bar(x + width / 2, guessed_others, width, label="Other Artist", color="#FF4C4C")
-
-    for i, bar in enumerate(bars_chosen):
-        h = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width() / 2, h * 0.5, guessed_artists[i][0], ha='center', va='center', fontsize=9, rotation=90, color='white')
-        ax.text(bar.get_x() + bar.get_width() / 2, h + 10000, f"{int(h):,}", ha='center', va='bottom', fontsize=9, color='white')
-
-    for i, bar in enumerate(bars_other):
-        h = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width() / 2, h * 0.5, guessed_artists[i][1], ha='center', va='center', fontsize=9, rotation=90, color='white')
-        ax.text(bar.get_x() + bar.get_width() / 2, h + 10000, f"{int(h):,}", ha='center', va='bottom', fontsize=9, color='white')
-
-    ax.set_xticks(x)
-    ax.set_xticklabels([f"Guess {i+1}" for i in range(len(guessed_listeners))], color='white')
-    ax.set_xlabel("Guess Number", color='white')
-    ax.set_ylabel("Monthly Listeners", color='white')
-    ax.set_title("Game Progression", color='white')
-    ax.legend(facecolor='#1e1e1e', edgecolor='white', labelcolor='white')
-    ax.tick_params(colors='white')
-    for spine in ax.spines.values():
-        spine.set_color('white')
-
-    img = io.BytesIO()
-    plt.savefig(img, format='png', bbox_inches="tight", facecolor=fig.get_facecolor())
-    img.seek(0)
-    return base64.b64encode(img.getvalue()).decode()
+
+def read_catalog(path):
+    if os.path.exists(path):
+        # Only needed when the snapshot is stale, so keep it off the import path.
+        import pandas as pd
+        df = pd.read_csv(path)
+        if not df.empty:
+            return Catalog.from_dataframe(df)
+    return Catalog.from_rows([], [])
+
+# The catalog is compiled to a snapshot and memory-mapped back, so worker
+# processes forked from here (see serve.py) share one read-only copy. The CSV
+# is only parsed again when it no longer matches the snapshot.
+catalogs = CatalogStore.from_source(csv_file, read_catalog, app.config['CATALOG_SNAPSHOT_DIR'])
+
+# One rebuild at a time; uploads queue behind each other off the request thread.
+rebuild_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='catalog-rebuild')
+
+# Pairs pre-drawn per refill of a session's round queue.
+ROUND_QUEUE_SIZE = 8
+
+# Below this, gzip framing costs more than it saves.
+API_GZIP_MIN_SIZE = 256
+
+_static_hashes = {}
+
+@app.template_global()
+def static_url(filename):
+    """url_for('static') with a content hash, so a changed file gets a new URL."""
+    digest = _static_hashes.get(filename)
+    if digest is None:
+        with open(os.path.join(app.static_folder, filename), 'rb') as f:
+            digest = _static_hashes[filename] = hashlib.sha1(f.read()).hexdigest()[:12]
+    return url_for('static', filename=filename, v=digest)
+
+PLACEHOLDER_ARTISTS = [
+    {"Artist": "No Data Available", "MonthlyListeners": 0},
+    {"Artist": "Please Upload CSV", "MonthlyListeners": 0}
+]
+
+def game_catalog():
+    """Catalog the current game is dealt from, pinned across uploads."""
+    catalog = catalogs.get(session.get('catalog_version'))
+    if catalog is None or session.get('pair') is None:
+        # New game, or its catalog version has aged out: start over on the live one.
+        for key in ('pair', 'queue', 'history', 'correct_guesses'):
+            session.pop(key, None)
+        catalog = catalogs.current
+        session['catalog_version'] = catalog.version
+    return catalog
+
+def next_pair(catalog):
+    """Pop the next pre-drawn pair, refilling the session's queue a batch at a time."""
+    if len(catalog) < 2:
+        return None
+    queue = session.get('queue')
+    if not queue:
+        # Nothing the game has shown, or is showing, can come back.
+        shown = list(session.get('history', ())) + list(session.get('pair') or ())
+        ratio = rounds.DIFFICULTIES[session.get('difficulty', 'normal')]
+        with metrics.timer('sampling'):
+            pairs = rounds.generator.deal(catalog, ROUND_QUEUE_SIZE, shown, ratio)
+        queue = array('i', pairs.ravel().tolist())
+        if not queue:
+            return None
+    session['queue'] = queue[2:]
+    return queue[0], queue[1]
+
+def current_artists(catalog):
+    pair = session.get('pair')
+    if pair is None:
+        return PLACEHOLDER_ARTISTS
+    return [catalog.record(pair[0]), catalog.record(pair[1])]
+
+def chart_inputs(catalog, history):
+    """Expand the game history, stored as flat (chosen, other) catalog rows."""
+    rows = np.array(history, dtype=np.intp).reshape(-1, 2)
+    guessed_listeners = catalog.listeners[rows[:, 0]].tolist()
+    guessed_others = catalog.listeners[rows[:, 1]].tolist()
+    guessed_artists = [(catalog.names[a], catalog.names[b]) for a, b in rows.tolist()]
+    return guessed_listeners, guessed_others, guessed_artists
+
+def chart_url(catalog, history):
+    if not history:
+        return None
+    key = charts.progression_chart(*chart_inputs(catalog, history))
+    return url_for('chart', key=key)
+
+def rerender_chart(key):
+    """Rebuild a chart this process has not rendered, e.g. one drawn by another worker."""
+    if session.get('chart'):
+        version, history = session['chart']
+        catalog = catalogs.get(version)
+        if catalog is not None:
+            inputs = chart_inputs(catalog, history)
+            if charts.progression_key(*inputs) == key:
+                charts.progression_chart(*inputs)
+                return charts.lookup(key)
+    if charts.histogram_chart(catalogs.current) == key:
+        return charts.lookup(key)
+    return None
+
+@app.before_request
+def _before_request():
+    if metrics.registry.enabled and request.url_rule is not None:
+        request.environ[metrics.ROUTE_KEY] = request.url_rule.rule
+    db.connect(reuse_if_open=True)
+    catalogs.refresh()
+
+@before_render_template.connect_via(app)
+def _template_start(sender, template, context, **extra):
+    if metrics.registry.enabled:
+        g.render_start = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def _template_done(sender, template, context, **extra):
+    start = g.pop('render_start', None)
+    if start is not None:
+        metrics.registry.observe('stage', 'template_render', time.perf_counter() - start)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Latency histograms for this process, in Prometheus text format (or ?format=json)."""
+    if not metrics.registry.enabled:
+        abort(404)
+    if request.args.get('format') == 'json':
+        return jsonify(metrics.registry.summary())
+    return app.response_class(metrics.registry.prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.teardown_request
+def _teardown_request(exc):
+    if not db.is_closed():
+        db.close()
 
 @app.route('/')
 def index():
     session.setdefault('gradient', 'purple')
-    if 'artist1' not in session or 'artist2' not in session:
-        artists = get_random_artists()
-        session['artist1'], session['artist2'] = artists
+    catalog = game_catalog()
+    if 'pair' not in session:
+        session['pair'] = next_pair(catalog)
+    artist1, artist2 = current_artists(catalog)
     return render_template('index.html',
-        artist1=session['artist1'],
-        artist2=session['artist2'],
-        settings={'gradient': session['gradient']}
+        artist1=artist1,
+        artist2=artist2,
+        settings={'gradient': session['gradient'], 'difficulty': session.get('difficulty', 'normal')}
     )
 
-@app.route('/game_over')
-def game_over():
-    score = session.get('correct_guesses', 0)
-    guessed_listeners = session.get('guessed_listeners', [])
-    guessed_others = session.get('guessed_others', [])
-    guessed_artists = session.get('guessed_artists', [])
-    plot_url = generate_chart(guessed_listeners, guessed_others, guessed_artists) if guessed_listeners else None
+@app.route('/difficulty', methods=['POST'])
+def set_difficulty():
+    difficulty = request.form.get('difficulty')
+    if difficulty in rounds.DIFFICULTIES:
+        session['difficulty'] = difficulty
+        # Pairs already drawn were for the old setting.
+        session.pop('queue', None)
+    return redirect(url_for('index'))
+
+def render_game_over():
+    if 'correct_guesses' in session:
+        # Still playing: show the game so far.
+        score = session['correct_guesses']
+        catalog = catalogs.get(session.get('catalog_version'))
+        history = session.get('history')
+    else:
+        score = session.get('last_score', 0)
+        version, history = session.get('chart', (None, None))
+        catalog = catalogs.get(version)
+    plot_url = chart_url(catalog, history) if catalog else None
     return render_template('game_over.html',
         score=score,
         plot_url=plot_url,
+        rank=leaderboard_cache.rank(score),
+        can_submit='pending_score' in session,
+        player_name=session.get('player_name', ''),
         settings={'gradient': session.get('gradient', 'purple')}
     )
 
+@app.route('/game_over')
+def game_over():
+    return render_game_over()
+
+@app.route('/leaderboard', methods=['GET', 'POST'])
+def leaderboard():
+    if request.method == 'POST':
+        score = session.pop('pending_score', None)
+        if score is not None:
+            name = request.form.get('name', '').strip()[:32] or 'Anonymous'
+            session['player_name'] = name
+            leaderboard_cache.submit(name, score)
+            # The write is queued; show it on the next page whether or not it has landed.
+            session['saved_score'] = (name, score)
+        return redirect(url_for('leaderboard'))
+    return render_template('leaderboard.html',
+        scores=leaderboard_cache.top(extra=session.pop('saved_score', None)),
+        settings={'gradient': session.get('gradient', 'purple')}
+    )
+
+@app.route('/plot')
+def plot():
+    """Displays the listener histogram, rendered once per catalog version."""
+    catalog = catalogs.current
+    if len(catalog) == 0:
+        return "Nav pieejami dati histogrammai. Lūdzu augšupielādējiet CSV."
+    key = charts.histogram_chart(catalog)
+    return render_template('plot.html', plot_url=url_for('chart', key=key))
+
+@app.route('/chart/<key>.png')
+def chart(key):
+    png = charts.lookup(key) or rerender_chart(key)
+    if png is None:
+        abort(404)
+    response = app.response_class(png, mimetype='image/png')
+    # Keys are content hashes, so a given URL never changes its bytes.
+    response.set_etag(key)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+def end_game(catalog):
+    """Clear the finished game, keeping preferences and what the game-over page needs."""
+    score = session['correct_guesses']
+    history = session['history']
+    kept = {key: session[key] for key in ('gradient', 'difficulty', 'player_name') if key in session}
+    session.clear()
+    session.update(kept)
+    session['last_score'] = session['pending_score'] = score
+    session['chart'] = (catalog.version, history)
+
+def play_guess(chosen, other):
+    """Score one guess and advance the session; shared by the page and the JSON API."""
+    session.setdefault('gradient', 'purple')
+    catalog = game_catalog()
+    outcome = {'chosen': chosen, 'other': other, 'chosen_listener': 0, 'other_listener': 0}
+
+    with metrics.timer('catalog_lookup'):
+        chosen_row = catalog.row(chosen)
+        other_row = catalog.row(other)
+    if chosen_row is None or other_row is None:
+        outcome['result'] = 'error'
+        return outcome, catalog
+
+    chosen_listener = int(catalog.listeners[chosen_row])
+    other_listener = int(catalog.listeners[other_row])
+    outcome.update(chosen_listener=chosen_listener, other_listener=other_listener)
+
+    session.setdefault('history', array('i')).extend((chosen_row, other_row))
+    session.setdefault('correct_guesses', 0)
+    # In-place array updates are invisible to the session's change tracking.
+    session.modified = True
+
+    if chosen_listener > other_listener:
+        session['correct_guesses'] += 1
+        session['pair'] = next_pair(catalog)
+        outcome.update(result='win', score=session['correct_guesses'])
+        return outcome, catalog
+
+    outcome.update(result='game_over', score=session['correct_guesses'])
+    end_game(catalog)
+    return outcome, catalog
+
 @app.route('/guess', methods=['POST'])
 def guess():
-    chosen = request.form['chosen']
-    other = request.form['other']
-    session.setdefault('gradient', 'purple')
+    outcome, catalog = play_guess(request.form['chosen'], request.form['other'])
 
-    if df.empty or chosen not in df['Artist'].values or other not in df['Artist'].values:
+    if outcome['result'] == 'error':
         return render_template('result.html',
             result='error',
-            chosen=chosen,
-            other=other,
+            chosen=outcome['chosen'],
+            other=outcome['other'],
             chosen_listener=0,
             other_listener=0,
             settings={'gradient': session['gradient']}
         )
 
-    chosen_listener = int(df.loc[df['Artist'] == chosen, 'MonthlyListeners'].values[0])
-    other_listener = int(df.loc[df['Artist'] == other, 'MonthlyListeners'].values[0])
-
-    session.setdefault('guessed_listeners', []).append(chosen_listener)
-    session.setdefault('guessed_others', []).append(other_listener)
-    session.setdefault('guessed_artists', []).append((chosen, other))
-    session.setdefault('correct_guesses', 0)
-
-    if chosen_listener > other_listener:
-        session['correct_guesses'] += 1
-        new_artists = get_random_artists()
-        session['artist1'], session['artist2'] = new_artists
+    if outcome['result'] == 'win':
+        artist1, artist2 = current_artists(catalog)
         return render_template('index.html',
-            artist1=session['artist1'],
-            artist2=session['artist2'],
-            score=session['correct_guesses'],
-            settings={'gradient': session['gradient']}
+            artist1=artist1,
+            artist2=artist2,
+            score=outcome['score'],
+            settings={'gradient': session['gradient'], 'difficulty': session.get('difficulty', 'normal')}
         )
 
-    score = session['correct_guesses']
-    guessed_listeners = session['guessed_listeners']
-    guessed_others = session['guessed_others']
-    guessed_artists = session['guessed_artists']
-    plot_url = generate_chart(guessed_listeners, guessed_others, guessed_artists) if guessed_listeners else None
-    gradient = session.get('gradient', 'purple')
-    session.clear()
-    session['gradient'] = gradient
+    return render_game_over()
 
-    return render_template('game_over.html',
-        score=score,
-        plot_url=plot_url,
-        settings={'gradient': gradient}
-    )
+@app.route('/api/guess', methods=['POST'])
+def api_guess():
+    """JSON twin of /guess: returns the result and the next pair instead of a page."""
+    data = request.get_json(silent=True) or request.form
+    if not isinstance(data, dict):
+        data = {}
+    chosen, other = data.get('chosen'), data.get('other')
+    if not isinstance(chosen, str) or not isinstance(other, str):
+        return jsonify(result='error', message="Expected 'chosen' and 'other' artist names."), 400
+
+    outcome, catalog = play_guess(chosen, other)
+    if outcome['result'] == 'win':
+        outcome['artists'] = [artist['Artist'] for artist in current_artists(catalog)]
+    elif outcome['result'] == 'game_over':
+        outcome['redirect'] = url_for('game_over')
+    return jsonify(outcome)
+
+@app.after_request
+def _compress_api(response):
+    """Gzip JSON fragments for clients that accept it."""
+    if (not request.path.startswith('/api/')
+            or response.direct_passthrough
+            or 'gzip' not in request.headers.get('Accept-Encoding', '')
+            or 'Content-Encoding' in response.headers):
+        return response
+    data = response.get_data()
+    if len(data) < API_GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def write_source(catalog):
+    """Rewrite the CSV and stamp the catalog with it; runs under the publish lock."""
+    write_csv(csv_file, catalog)
+    catalog.source = source_stamp(csv_file)
+
+def rebuild_catalog(names, listeners):
+    catalog = Catalog.from_rows(names, listeners)
+    if len(catalog) < 2:
+        # Never replace the CSV with a catalog no game can be dealt from.
+        raise UploadError(f"Refusing to publish a catalog of {len(catalog)} artist(s).")
+    version = catalogs.publish(catalog, prepare=write_source)
+    app.logger.info("Published catalog version %d with %d artists", version, len(catalog))
+    return version
+
+def _log_rebuild_failure(future):
+    if future.exception() is not None:
+        app.logger.error("Catalog rebuild failed", exc_info=future.exception())
+
+@app.route('/upload', methods=['GET', 'POST'])
+def upload():
+    if request.method == 'GET':
+        return render_template('upload.html')
+
+    # Read the multipart body straight off the socket so large files are never
+    # buffered whole; rows are validated as each chunk arrives.
+    try:
+        chunks = iter_file_chunks(request.stream, request.content_type or '')
+        names, listeners = read_rows(iter_lines(chunks))
+    except UploadError as e:
+        return render_template('upload.html', error=str(e)), 400
+
+    future = rebuild_executor.submit(rebuild_catalog, names, listeners)
+    future.add_done_callback(_log_rebuild_failure)
+    return render_template('upload.html',
+        message=f"Uploaded {len(names):,} rows. The new catalog goes live once it is built; games in progress finish on the current one."
+    ), 202
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""Replay benchmark: plays synthetic games through the Flask test client.
+
+    python bench_games.py --games 2000
+    python bench_games.py --games 2000 --api --submit 0.3
+    python bench_games.py --games 2000 --no-metrics     # overhead check
+
+Runs in a scratch directory with a copy of the CSV, so the leaderboard,
+session and snapshot files of the checkout are left alone. Each game wins a
+random number of rounds and then loses on purpose, opens the game-over page
+and fetches its chart. Reports per-route p50/p99, throughput, the stage
+timings from /metrics and how much the process grew after warm-up; a
+steady climb in RSS or live figures points at a leak.
+"""
+import argparse
+import gc
+import html
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PAIR_RE = re.compile(r'name="chosen" value="([^"]*)">\s*<input type="hidden" name="other" value="([^"]*)"')
+CHART_RE = re.compile(r'<img src="([^"]+)" alt="Guess Progression">')
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def live_figures():
+    if 'matplotlib.figure' not in sys.modules:
+        return 0
+    figure = sys.modules['matplotlib.figure'].Figure
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, figure))
+
+
+class Player:
+    """One browser: a test client plus the pair it is currently looking at."""
+
+    def __init__(self, app_module, use_api, timings):
+        self.app = app_module
+        self.client = app_module.app.test_client()
+        self.use_api = use_api
+        self.timings = timings
+        self.pair = None
+
+    def request(self, label, method, path, **kwargs):
+        start = time.perf_counter()
+        response = self.client.open(path, method=method, **kwargs)
+        data = response.get_data()
+        self.timings.setdefault(label, []).append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}")
+        return response, data
+
+    def read_pair(self, page):
+        match = PAIR_RE.search(page.decode('utf-8'))
+        self.pair = tuple(html.unescape(v) for v in match.groups()) if match else None
+
+    def answer(self, win):
+        first, second = self.pair
+        listeners = self.app.catalogs.current.listeners_for
+        higher = listeners(first) > listeners(second)
+        if higher == win:
+            return first, second
+        return second, first
+
+    def play(self, rounds, submit):
+        _, page = self.request('GET /', 'GET', '/')
+        self.read_pair(page)
+        for n in range(rounds + 1):
+            if self.pair is None:
+                break
+            chosen, other = self.answer(win=n < rounds)
+            if self.use_api:
+                response, _ = self.request('POST /api/guess', 'POST', '/api/guess',
+                                           json={'chosen': chosen, 'other': other})
+                outcome = response.get_json()
+                self.pair = tuple(outcome['artists']) if outcome['result'] == 'win' else None
+                if outcome['result'] == 'game_over':
+                    _, page = self.request('GET /game_over', 'GET', outcome['redirect'])
+            else:
+                _, page = self.request('POST /guess', 'POST', '/guess',
+                                       data={'chosen': chosen, 'other': other})
+                self.read_pair(page)
+        chart = CHART_RE.search(page.decode('utf-8'))
+        if chart:
+            self.request('GET /chart', 'GET', html.unescape(chart.group(1)))
+        if submit:
+            self.request('POST /leaderboard', 'POST', '/leaderboard', data={'name': 'bench'})
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def report(timings, elapsed, games, memory, stages):
+    total = sum(len(v) for v in timings.values())
+    print(f"{games} games, {total} requests in {elapsed:.1f} s "
+          f"({total / elapsed:.0f} req/s, {games / elapsed:.1f} games/s)")
+    print(f"{'route':<20} {'count':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for label, values in sorted(timings.items()):
+        values.sort()
+        print(f"{label:<20} {len(values):>7} {percentile(values, 0.5) * 1000:>8.2f} "
+              f"{percentile(values, 0.99) * 1000:>8.2f}")
+    if stages:
+        print(f"\n{'stage (server side)':<20} {'count':>7} {'p50 ms':>8} {'p99 ms':>8}")
+        for name, s in stages.items():
+            if name.startswith('stage:'):
+                print(f"{name[6:]:<20} {s['count']:>7} {s['p50'] * 1000:>8.2f} {s['p99'] * 1000:>8.2f}")
+    (rss0, figs0, cached0), (rss1, figs1, cached1) = memory
+    print(f"\nafter warm-up: rss {rss0 / 2**20:.1f} MiB, live figures {figs0}, cached charts {cached0}")
+    print(f"at the end:    rss {rss1 / 2**20:.1f} MiB, live figures {figs1}, cached charts {cached1}")
+    print(f"growth:        {(rss1 - rss0) / 2**20:+.1f} MiB "
+          f"({(rss1 - rss0) / 1024 / max(games, 1) * 1000:+.0f} KiB per 1000 games)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=200, help="games played before measuring")
+    parser.add_argument('--players', type=int, default=50, help="concurrent sessions to rotate through")
+    parser.add_argument('--max-rounds', type=int, default=30)
+    parser.add_argument('--api', action='store_true', help="play through /api/guess instead of /guess")
+    parser.add_argument('--submit', type=float, default=0.0, help="fraction of games that save a score")
+    parser.add_argument('--no-metrics', action='store_true', help="run with instrumentation disabled")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bench-games-')
+    shutil.copy(os.path.join(HERE, 'spotify_top500.csv'), workdir)
+    os.environ.update(
+        CATALOG_SNAPSHOT_DIR=os.path.join(workdir, 'catalog_snapshot'),
+        SESSION_BACKEND='memory',
+        METRICS_ENABLED='0' if args.no_metrics else '1',
+    )
+    os.chdir(workdir)
+    sys.path.insert(0, HERE)
+    try:
+        import app as app_module
+
+        rng = random.Random(args.seed)
+        timings = {}
+        players = [Player(app_module, args.api, timings) for _ in range(args.players)]
+
+        def play(count):
+            for i in range(count):
+                # Mostly short games with a long tail, like real players.
+                rounds = min(int(rng.expovariate(1 / 5)), args.max_rounds)
+                players[i % len(players)].play(rounds, rng.random() < args.submit)
+
+        play(args.warmup)
+        timings.clear()
+        app_module.metrics.registry.reset()
+        gc.collect()
+        before = (rss_bytes(), live_figures(), len(app_module.charts.cache))
+
+        start = time.perf_counter()
+        play(args.games)
+        elapsed = time.perf_counter() - start
+
+        app_module.leaderboard_cache.flush()
+        gc.collect()
+        after = (rss_bytes(), live_figures(), len(app_module.charts.cache))
+        report(timings, elapsed, args.games, (before, after), app_module.metrics.registry.summary())
+    finally:
+        os.chdir(HERE)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Cold-start benchmark: import time and first-request latency of app.py.
+
+    python bench_startup.py                  # this checkout
+    python bench_startup.py --app-dir DIR    # e.g. a `git worktree` of an older commit
+
+Each trial runs in a fresh interpreter. "cold" starts with an empty snapshot
+directory, so the CSV has to be compiled; "warm" reuses the snapshot the
+previous trial left behind.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+client = app.app.test_client()
+client.get('/')
+t2 = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'first_request_ms': (t2 - t1) * 1000,
+    'pandas': 'pandas' in sys.modules,
+    'matplotlib': 'matplotlib' in sys.modules,
+}))
+"""
+
+
+def trial(app_dir, snapshot_dir):
+    env = dict(os.environ, CATALOG_SNAPSHOT_DIR=snapshot_dir, SESSION_BACKEND='memory')
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=app_dir, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def summarize(name, results):
+    imports = [r['import_ms'] for r in results]
+    firsts = [r['first_request_ms'] for r in results]
+    loaded = [m for m in ('pandas', 'matplotlib') if results[-1][m]]
+    print(f"{name:<6} import {statistics.median(imports):8.1f} ms   "
+          f"first request {statistics.median(firsts):7.1f} ms   "
+          f"loaded: {', '.join(loaded) or '-'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app-dir', default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument('--trials', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    cold, warm = [], []
+    for _ in range(args.trials):
+        snapshot_dir = tempfile.mkdtemp(prefix='catalog-snapshot-')
+        try:
+            cold.append(trial(args.app_dir, snapshot_dir))
+            warm.append(trial(args.app_dir, snapshot_dir))
+        finally:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+    print(f"{args.app_dir} (median of {args.trials})")
+    summarize('cold', cold)
+    summarize('warm', warm)
+
+
+if __name__ == '__main__':
+    main()
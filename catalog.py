@@ -0,0 +1,317 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server only
+    fcntl = None
+
+ARRAYS = ('blob', 'offsets', 'hashes', 'slots', 'listeners', 'order', 'sorted_listeners')
+
+
+def version_dir(snapshot_dir, version):
+    return os.path.join(snapshot_dir, f"v{version}")
+
+
+def read_current_version(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, 'CURRENT')) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def source_stamp(path):
+    """Identify a CSV by mtime and size, plus a content hash for when only the mtime moved."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'sha1': digest.hexdigest()}
+
+
+def source_matches(stamp, path):
+    """True if ``path`` still holds the file ``stamp`` was taken from."""
+    if not stamp:
+        return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_size != stamp['size']:
+        return False
+    if st.st_mtime_ns == stamp['mtime_ns']:
+        return True
+    current = source_stamp(path)
+    return current is not None and current['sha1'] == stamp['sha1']
+
+
+class NameTable:
+    """Artist names packed as one UTF-8 byte blob plus row offsets."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def encoded(self, row):
+        return self.blob[self.offsets[row]:self.offsets[row + 1]].tobytes()
+
+    def __getitem__(self, row):
+        return self.encoded(row).decode('utf-8')
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+
+class Catalog:
+    """Read-only artist catalog built once from the CSV data.
+
+    Everything lives in flat NumPy arrays: names as a UTF-8 blob with offsets,
+    listener counts as int64, and an open-addressing hash table from name to
+    row. Validating and looking up a guess is an O(1) probe with no per-request
+    allocation, and because nothing is a Python object the arrays can be
+    memory-mapped from a snapshot and shared by every worker process.
+    ``order`` lists rows by listener count and ``sorted_listeners`` holds the
+    counts in that order, for binary searches by listener range.
+    """
+
+    def __init__(self, blob, offsets, hashes, slots, listeners, order, sorted_listeners, version=0, source=None):
+        self.version = version
+        # source_stamp() of the CSV this catalog was compiled from, if any.
+        self.source = source
+        self.names = NameTable(blob, offsets)
+        self.hashes = hashes
+        self.slots = slots
+        self.listeners = listeners
+        self.order = order
+        self.sorted_listeners = sorted_listeners
+        self._mask = len(slots) - 1
+
+    @classmethod
+    def from_dataframe(cls, df, version=0):
+        if df.empty:
+            return cls.from_rows([], [], version)
+        return cls.from_rows(df['Artist'].astype(str).tolist(), df['MonthlyListeners'].to_numpy(), version)
+
+    @classmethod
+    def from_rows(cls, names, listeners, version=0):
+        """Build the packed arrays, keeping the first row for duplicated names."""
+        listeners = np.asarray(listeners, dtype=np.int64)
+        size = 8
+        while size < 2 * len(names):
+            size *= 2
+        mask = size - 1
+        slots = [0] * size
+        encoded, hashes, keep = [], [], []
+        for row, name in enumerate(names):
+            data = name.encode('utf-8')
+            h = zlib.crc32(data)
+            i = h & mask
+            while slots[i]:
+                other = slots[i] - 1
+                if hashes[other] == h and encoded[other] == data:
+                    break
+                i = (i + 1) & mask
+            else:
+                slots[i] = len(keep) + 1
+                encoded.append(data)
+                hashes.append(h)
+                keep.append(row)
+
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        listeners = np.ascontiguousarray(listeners[np.array(keep, dtype=np.intp)])
+        order = np.argsort(listeners, kind='stable')
+        return cls(
+            np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            offsets,
+            np.array(hashes, dtype=np.uint32),
+            np.array(slots, dtype=np.int64),
+            listeners,
+            order,
+            np.ascontiguousarray(listeners[order]),
+            version,
+        )
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        arrays = (self.names.blob, self.names.offsets, self.hashes, self.slots, self.listeners,
+                  self.order, self.sorted_listeners)
+        for name, array in zip(ARRAYS, arrays):
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'version': self.version, 'rows': len(self), 'source': self.source}, f)
+
+    @classmethod
+    def load(cls, directory):
+        """Memory-map a saved snapshot; the pages are shared between processes."""
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        # Plain ndarray views over the maps: same shared pages, without np.memmap's
+        # per-index overhead on the lookup path.
+        arrays = [np.asarray(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')) for name in ARRAYS]
+        return cls(*arrays, version=meta['version'], source=meta.get('source'))
+
+    def __len__(self):
+        return len(self.listeners)
+
+    def __contains__(self, name):
+        return self.row(name) is not None
+
+    def row(self, name):
+        data = name.encode('utf-8', 'surrogatepass')
+        h = zlib.crc32(data)
+        i = h & self._mask
+        while True:
+            slot = int(self.slots[i])
+            if not slot:
+                return None
+            row = slot - 1
+            if self.hashes[row] == h and self.names.encoded(row) == data:
+                return row
+            i = (i + 1) & self._mask
+
+    def listeners_for(self, name):
+        row = self.row(name)
+        return None if row is None else int(self.listeners[row])
+
+    def record(self, row):
+        return {"Artist": self.names[row], "MonthlyListeners": int(self.listeners[row])}
+
+
+class CatalogStore:
+    """Holds the live catalog plus a few recent versions.
+
+    Publishing a rebuilt catalog is a single reference swap, so readers never
+    see a half-built one. Games remember the version they were dealt from and
+    keep resolving it here until it falls out of the recent window.
+
+    With ``snapshot_dir`` set, every version is written to disk and served
+    from a read-only memory map, so worker processes share one copy. A
+    ``CURRENT`` file names the live version and ``refresh()`` lets a worker
+    pick up versions another worker published.
+    """
+
+    def __init__(self, catalog, keep=8, snapshot_dir=None, poll_interval=1.0, write=True):
+        self.keep = keep
+        self.snapshot_dir = snapshot_dir
+        self.poll_interval = poll_interval
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+        if snapshot_dir and write:
+            os.makedirs(snapshot_dir, exist_ok=True)
+            catalog = self._write_snapshot(catalog, 0)
+        self._recent = OrderedDict([(catalog.version, catalog)])
+        self.current = catalog
+
+    @classmethod
+    def from_source(cls, path, build, snapshot_dir, **kwargs):
+        """Open the live snapshot if it was compiled from ``path`` as it is now.
+
+        Otherwise ``build(path)`` a fresh catalog and snapshot it. The check is
+        a stat() when the CSV is untouched, and a hash only if its mtime moved.
+        """
+        version = read_current_version(snapshot_dir)
+        if version is not None:
+            directory = version_dir(snapshot_dir, version)
+            try:
+                snapshot = Catalog.load(directory)
+            except (OSError, ValueError, KeyError):
+                snapshot = None
+            if snapshot is not None and source_matches(snapshot.source, path):
+                return cls(snapshot, snapshot_dir=snapshot_dir, write=False, **kwargs)
+        catalog = build(path)
+        catalog.source = source_stamp(path)
+        return cls(catalog, snapshot_dir=snapshot_dir, **kwargs)
+
+    def get(self, version):
+        catalog = self._recent.get(version)
+        if catalog is None and self.snapshot_dir and isinstance(version, int):
+            # Another worker may have dealt this game from a version we never loaded.
+            directory = version_dir(self.snapshot_dir, version)
+            try:
+                catalog = Catalog.load(directory)
+            except (OSError, ValueError, KeyError):
+                catalog = None
+            if catalog is not None:
+                with self._lock:
+                    self._recent.setdefault(version, catalog)
+                    self._trim()
+        return catalog
+
+    def publish(self, catalog, prepare=None):
+        """Make ``catalog`` the live version and return its number.
+
+        ``prepare(catalog)`` runs first, under the same lock that serializes
+        publishing across processes, e.g. to write the source file the
+        snapshot is stamped with.
+        """
+        with self._lock:
+            if self.snapshot_dir:
+                catalog = self._write_snapshot(catalog, self.current.version, prepare)
+            else:
+                if prepare is not None:
+                    prepare(catalog)
+                catalog.version = self.current.version + 1
+            self._recent[catalog.version] = catalog
+            self._trim()
+            self.current = catalog
+        return catalog.version
+
+    def refresh(self):
+        """Adopt a version another process published, checking at most once per poll interval."""
+        if not self.snapshot_dir:
+            return
+        now = time.monotonic()
+        if now < self._next_poll:
+            return
+        self._next_poll = now + self.poll_interval
+        version = read_current_version(self.snapshot_dir)
+        if version is not None and version > self.current.version:
+            catalog = self.get(version)
+            if catalog is not None:
+                with self._lock:
+                    if catalog.version > self.current.version:
+                        self.current = catalog
+
+    def _trim(self):
+        while len(self._recent) > self.keep:
+            self._recent.popitem(last=False)
+
+    def _write_snapshot(self, catalog, known_version, prepare=None):
+        with open(os.path.join(self.snapshot_dir, '.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if prepare is not None:
+                prepare(catalog)
+            catalog.version = max(read_current_version(self.snapshot_dir) or 0, known_version) + 1
+            directory = version_dir(self.snapshot_dir, catalog.version)
+            tmp_dir = f"{directory}.tmp{os.getpid()}"
+            catalog.save(tmp_dir)
+            shutil.rmtree(directory, ignore_errors=True)
+            os.replace(tmp_dir, directory)
+            tmp_current = os.path.join(self.snapshot_dir, f"CURRENT.tmp{os.getpid()}")
+            with open(tmp_current, 'w') as f:
+                f.write(str(catalog.version))
+            os.replace(tmp_current, os.path.join(self.snapshot_dir, 'CURRENT'))
+            # Processes still mapping a pruned version keep its pages until they let go.
+            for entry in os.listdir(self.snapshot_dir):
+                if entry[:1] == 'v' and entry[1:].isdigit() and int(entry[1:]) <= catalog.version - self.keep:
+                    shutil.rmtree(os.path.join(self.snapshot_dir, entry), ignore_errors=True)
+        return Catalog.load(directory)
@@ -0,0 +1,138 @@
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+
+
+class ChartCache:
+    """Bounded LRU of rendered PNGs keyed by a hash of what was drawn."""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+            return png
+
+    def put(self, key, png):
+        with self._lock:
+            self._entries[key] = png
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+cache = ChartCache()
+
+# Figures are independent objects, but matplotlib's text layout and font
+# caches are shared module state, so renders still take turns.
+_render_lock = threading.Lock()
+
+# (catalog version, key, png), replaced as a whole so readers never see a mix.
+_histogram = (None, None, None)
+_histogram_lock = threading.Lock()
+
+
+def _figure(**kwargs):
+    # matplotlib costs hundreds of milliseconds to import; most requests never
+    # draw a chart, so it is only loaded when the first one is rendered.
+    from matplotlib.figure import Figure
+    return Figure(**kwargs)
+
+
+def _to_png(fig, **kwargs):
+    img = io.BytesIO()
+    fig.savefig(img, format='png', **kwargs)
+    return img.getvalue()
+
+
+def progression_key(guessed_listeners, guessed_others, guessed_artists):
+    payload = json.dumps([guessed_listeners, guessed_others, guessed_artists], separators=(',', ':'))
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def render_progression(guessed_listeners, guessed_others, guessed_artists):
+    x = np.arange(len(guessed_listeners))
+    width = 0.35
+    fig = _figure(figsize=(16, 6), facecolor='#1e1e1e')
+    ax = fig.subplots()
+    ax.set_facecolor('#1e1e1e')
+
+    bars_chosen = ax.bar(x - width / 2, guessed_listeners, width, label="Chosen Artist", color="#1E90FF")
+    bars_other = ax.bar(x + width / 2, guessed_others, width, label="Other Artist", color="#FF4C4C")
+
+    for i, bar in enumerate(bars_chosen):
+        h = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width() / 2, h * 0.5, guessed_artists[i][0], ha='center', va='center', fontsize=9, rotation=90, color='white')
+        ax.text(bar.get_x() + bar.get_width() / 2, h + 10000, f"{int(h):,}", ha='center', va='bottom', fontsize=9, color='white')
+
+    for i, bar in enumerate(bars_other):
+        h = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width() / 2, h * 0.5, guessed_artists[i][1], ha='center', va='center', fontsize=9, rotation=90, color='white')
+        ax.text(bar.get_x() + bar.get_width() / 2, h + 10000, f"{int(h):,}", ha='center', va='bottom', fontsize=9, color='white')
+
+    ax.set_xticks(x)
+    ax.set_xticklabels([f"Guess {i+1}" for i in range(len(guessed_listeners))], color='white')
+    ax.set_xlabel("Guess Number", color='white')
+    ax.set_ylabel("Monthly Listeners", color='white')
+    ax.set_title("Game Progression", color='white')
+    ax.legend(facecolor='#1e1e1e', edgecolor='white', labelcolor='white')
+    ax.tick_params(colors='white')
+    for spine in ax.spines.values():
+        spine.set_color('white')
+
+    return _to_png(fig, bbox_inches="tight", facecolor=fig.get_facecolor())
+
+
+def render_histogram(listeners):
+    fig = _figure(figsize=(8, 6))
+    ax = fig.subplots()
+    ax.hist(listeners, bins=20)
+    ax.grid(True)
+    ax.set_xlabel("Mēneša klausītāji")
+    ax.set_ylabel("Mākslinieku skaits")
+    ax.set_title("Spotify Top 500 Izkliede")
+    return _to_png(fig)
+
+
+def progression_chart(guessed_listeners, guessed_others, guessed_artists):
+    """Render (or reuse) the game progression chart and return its cache key."""
+    key = progression_key(guessed_listeners, guessed_others, guessed_artists)
+    if cache.get(key) is None:
+        with _render_lock, metrics.timer('chart_render'):
+            png = render_progression(guessed_listeners, guessed_others, guessed_artists)
+        cache.put(key, png)
+    return key
+
+
+def histogram_chart(catalog):
+    """Return the histogram key for this catalog version, rendering it once."""
+    global _histogram
+    with _histogram_lock:
+        version, key, _ = _histogram
+        if version != catalog.version or key is None:
+            with _render_lock, metrics.timer('chart_render'):
+                png = render_histogram(catalog.listeners)
+            key = hashlib.sha1(png).hexdigest()
+            _histogram = (catalog.version, key, png)
+        return key
+
+
+def lookup(key):
+    _, histogram_key, histogram_png = _histogram
+    if key == histogram_key:
+        return histogram_png
+    return cache.get(key)
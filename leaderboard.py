@@ -0,0 +1,188 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from peewee import fn
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+
+class ScoreRanks:
+    """Fenwick tree over score values: O(log max_score) inserts and rank queries."""
+
+    def __init__(self, size=64):
+        self._tree = [0] * (size + 1)
+        self.total = 0
+
+    def _grow(self, score):
+        size = len(self._tree) - 1
+        while size <= score:
+            size *= 2
+        counts = [self.count_at(s) for s in range(len(self._tree) - 1)]
+        self._tree = [0] * (size + 1)
+        self.total = 0
+        for s, count in enumerate(counts):
+            if count:
+                self.add(s, count)
+
+    def add(self, score, count=1):
+        if score >= len(self._tree) - 1:
+            self._grow(score)
+        self.total += count
+        i = score + 1
+        while i < len(self._tree):
+            self._tree[i] += count
+            i += i & -i
+
+    def count_at_most(self, score):
+        i = min(score + 1, len(self._tree) - 1)
+        result = 0
+        while i > 0:
+            result += self._tree[i]
+            i -= i & -i
+        return result
+
+    def count_at(self, score):
+        below = self.count_at_most(score - 1) if score > 0 else 0
+        return self.count_at_most(score) - below
+
+    def rank(self, score):
+        """1-based position a new ``score`` would take (ties share a rank)."""
+        return self.total - self.count_at_most(score) + 1
+
+
+class Leaderboard:
+    """Top-N cache, in-memory rank index and a write-behind queue for PlayerScore.
+
+    Game-over writes are queued and inserted by a background thread in batches,
+    one transaction per batch. Ranks are answered from memory. Rows committed
+    since the last look, by this process or any other, are folded in at most
+    once per ``refresh_interval`` with a rowid range query, and the cached
+    top-N is only dropped when one of them can enter it.
+    """
+
+    def __init__(self, model, size=10, batch_size=256, flush_interval=0.5, refresh_interval=1.0):
+        self.model = model
+        self.size = size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = None
+        self._top = None
+        self._top_generation = 0
+        self._ranks = ScoreRanks()
+        self._last_id = 0
+        self._next_refresh = 0.0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now < self._next_refresh:
+            return
+        with self._lock:
+            if now < self._next_refresh:
+                return
+            self._next_refresh = now + self.refresh_interval
+            model = self.model
+            query = (model
+                     .select(fn.MAX(model.id), model.score, fn.COUNT(model.id))
+                     .where(model.id > self._last_id)
+                     .group_by(model.score)
+                     .tuples())
+            scores = []
+            for last_id, score, count in query:
+                self._ranks.add(score, count)
+                self._last_id = max(self._last_id, last_id)
+                scores.append(score)
+            threshold = self._threshold()
+            # With nothing cached, still bump the generation so an in-flight top() read is discarded.
+            if scores and (threshold is None or max(scores) > threshold):
+                self._top_generation += 1
+                self._top = None
+
+    def rank(self, score):
+        self._refresh()
+        return self._ranks.rank(score)
+
+    def top(self, extra=None):
+        """Return the best ``size`` (name, score) rows.
+
+        ``extra`` is a (name, score) the caller just submitted. It is merged in
+        where it will rank unless already listed, so a player sees their score
+        before the write-behind batch reaches the database.
+        """
+        self._refresh()
+        top = self._top
+        if top is None:
+            generation = self._top_generation
+            top = list(self.model
+                       .select(self.model.name, self.model.score)
+                       .order_by(self.model.score.desc(), self.model.id)
+                       .limit(self.size)
+                       .tuples())
+            # New rows were folded in while we were reading; don't cache a stale list.
+            if generation == self._top_generation:
+                self._top = top
+        if extra is not None and tuple(extra) not in top:
+            position = sum(1 for _, score in top if score >= extra[1])
+            top = (top[:position] + [tuple(extra)] + top[position:])[:self.size]
+        return top
+
+    def _threshold(self):
+        top = self._top
+        if top is None:
+            return None
+        return top[-1][1] if len(top) >= self.size else -1
+
+    def submit(self, name, score):
+        self._ensure_writer()
+        self._queue.put((name, score))
+
+    def _ensure_writer(self):
+        # Started on first use so a pre-forking parent never owns the thread.
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._run, name='leaderboard-writer', daemon=True)
+                    self._writer.start()
+                    atexit.register(self.flush)
+
+    def _drain(self, first):
+        batch = [first]
+        # One deadline per batch, so a steady trickle of scores can't hold it open.
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        db = self.model._meta.database
+        with db.connection_context(), metrics.timer('sqlite_write'):
+            with db.atomic():
+                self.model.insert_many(batch, fields=[self.model.name, self.model.score]).execute()
+        # Let the next read fold these rows in rather than waiting out the interval.
+        self._next_refresh = 0.0
+
+    def _run(self):
+        while True:
+            batch = self._drain(self._queue.get())
+            try:
+                self._write(batch)
+            except Exception:
+                log.exception("Dropped %d leaderboard scores", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Block until every queued score has been committed."""
+        if self._writer is not None:
+            self._queue.join()
@@ -0,0 +1,151 @@
+"""Load generator that plays games over HTTP and reports throughput.
+
+Against a running server:
+
+    python loadgen.py --url http://127.0.0.1:8000 --clients 16 --duration 10
+
+Or start serve.py once per worker count and compare:
+
+    python loadgen.py --sweep 1,2,4,8 --clients 32 --duration 10
+"""
+import argparse
+import html
+import http.client
+import multiprocessing
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode, urlsplit
+
+PAIR_RE = re.compile(r'name="chosen" value="([^"]*)">\s*<input type="hidden" name="other" value="([^"]*)"')
+
+
+def request(host, port, method, path, cookie=None, body=None):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    headers = {}
+    if cookie:
+        headers['Cookie'] = cookie
+    if body is not None:
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    data = response.read()
+    set_cookie = response.getheader('Set-Cookie')
+    conn.close()
+    return response.status, data.decode('utf-8', 'replace'), set_cookie
+
+
+def client(args):
+    host, port, duration, seed = args
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+    cookie = None
+    page = None
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            match = PAIR_RE.search(page or '')
+            if match is None:
+                status, page, set_cookie = request(host, port, 'GET', '/', cookie)
+            else:
+                chosen, other = (html.unescape(v) for v in match.groups())
+                if rng.random() < 0.5:
+                    chosen, other = other, chosen
+                body = urlencode({'chosen': chosen, 'other': other})
+                status, page, set_cookie = request(host, port, 'POST', '/guess', cookie, body)
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            page = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if set_cookie:
+            cookie = set_cookie.split(';', 1)[0]
+        if status != 200:
+            errors += 1
+            page = None
+    return latencies, errors
+
+
+def run(host, port, clients, duration):
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(client, [(host, port, duration, seed) for seed in range(clients)])
+    latencies = sorted(lat for lats, _ in results for lat in lats)
+    errors = sum(err for _, err in results)
+    if not latencies:
+        return {'requests': 0, 'errors': errors, 'rps': 0.0, 'p50_ms': 0.0, 'p99_ms': 0.0}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / duration,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(host, port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on {host}:{port} did not come up")
+
+
+def sweep(worker_counts, clients, duration):
+    here = os.path.dirname(os.path.abspath(__file__))
+    rows = []
+    for workers in worker_counts:
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(here, 'serve.py'), '--workers', str(workers), '--port', str(port)],
+            cwd=here, stdout=subprocess.DEVNULL,
+        )
+        try:
+            wait_for('127.0.0.1', port)
+            rows.append((workers, run('127.0.0.1', port, clients, duration)))
+        finally:
+            server.terminate()
+            server.wait()
+    return rows
+
+
+def report(rows):
+    base = rows[0][1]['rps'] or 1.0
+    print(f"{'workers':>7} {'requests':>9} {'errors':>6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'scaling':>8}")
+    for workers, r in rows:
+        print(f"{workers!s:>7} {r['requests']:>9} {r['errors']:>6} {r['rps']:>9.1f} "
+              f"{r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['rps'] / base:>7.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="benchmark an already running server")
+    parser.add_argument('--sweep', help="comma-separated worker counts to start serve.py with")
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    if args.sweep:
+        counts = [int(n) for n in args.sweep.split(',')]
+        report(sweep(counts, args.clients, args.duration))
+    else:
+        url = urlsplit(args.url or 'http://127.0.0.1:8000')
+        report([('-', run(url.hostname, url.port or 80, args.clients, args.duration))])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import bisect
+import threading
+import time
+
+# Upper bounds in seconds, roughly 2x apart, from 50us to 10s.
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+ROUTE_KEY = 'metrics.route'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (an overestimate by design)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Registry:
+    """Named histograms for route latency, stage timings and sizes.
+
+    While disabled, ``timer()`` hands back a shared no-op context manager and
+    ``observe()`` returns at once, so instrumented code costs one attribute
+    check. Each process keeps its own numbers; under serve.py, /metrics shows
+    the worker that answered.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, kind, label, buckets=LATENCY_BUCKETS):
+        key = (kind, label)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def timer(self, stage):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self.histogram('stage', stage))
+
+    def observe(self, kind, label, value, buckets=LATENCY_BUCKETS):
+        if self.enabled:
+            self.histogram(kind, label, buckets).observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+    def summary(self):
+        return {
+            f"{kind}:{label}": {
+                'count': h.count,
+                'sum': h.sum,
+                'p50': h.quantile(0.5),
+                'p99': h.quantile(0.99),
+            }
+            for (kind, label), h in sorted(self._histograms.items())
+        }
+
+    def prometheus(self):
+        """Render every histogram in the Prometheus text exposition format."""
+        names = {
+            'route': ('request_duration_seconds', 'route'),
+            'stage': ('stage_duration_seconds', 'stage'),
+            'size': ('session_cookie_bytes', 'route'),
+        }
+        lines = []
+        for kind, (metric, label_name) in names.items():
+            entries = [(label, h) for (k, label), h in sorted(self._histograms.items()) if k == kind]
+            if not entries:
+                continue
+            lines.append(f"# TYPE {metric} histogram")
+            for label, h in entries:
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{{label_name}="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{label_name}="{label}",le="+Inf"}} {h.count}')
+                lines.append(f'{metric}_sum{{{label_name}="{label}"}} {h.sum}')
+                lines.append(f'{metric}_count{{{label_name}="{label}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+
+class RequestTimer:
+    """WSGI middleware recording whole-request latency and cookie bytes per route.
+
+    The app names the route by setting ``environ[ROUTE_KEY]``; requests that
+    never match one are filed under ``<unmatched>``.
+    """
+
+    def __init__(self, wsgi_app, registry):
+        self.wsgi_app = wsgi_app
+        self.registry = registry
+
+    def __call__(self, environ, start_response):
+        if not self.registry.enabled:
+            return self.wsgi_app(environ, start_response)
+        start = time.perf_counter()
+        cookie = [len(environ.get('HTTP_COOKIE', ''))]
+
+        def recording_start_response(status, headers, exc_info=None):
+            cookie[0] += sum(len(value) for name, value in headers if name.lower() == 'set-cookie')
+            return start_response(status, headers, exc_info)
+
+        body = self.wsgi_app(environ, recording_start_response)
+        route = environ.get(ROUTE_KEY, '<unmatched>')
+        self.registry.observe('route', route, time.perf_counter() - start)
+        self.registry.observe('size', route, cookie[0], SIZE_BUCKETS)
+        return body
+
+
+registry = Registry()
+timer = registry.timer
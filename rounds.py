@@ -0,0 +1,118 @@
+import os
+
+import numpy as np
+
+# Listener-count ratio a pair must fall within; None pairs any two artists.
+DIFFICULTIES = {
+    'normal': None,
+    'hard': 2.0,
+    'expert': 1.25,
+}
+
+
+class RoundGenerator:
+    """Deals artist pairs as (row, row) arrays in vectorized batches.
+
+    Candidates are drawn with one NumPy call per batch and filtered against
+    the rows a game has already shown, so the cost of a batch depends on the
+    batch and the game length, never on the catalog size. With a ratio set,
+    each anchor is paired with a partner found by binary search over the
+    catalog's sorted listener counts.
+    """
+
+    def __init__(self, seed=None, oversample=2):
+        self.rng = np.random.default_rng(seed)
+        self.oversample = oversample
+
+    def reseed(self):
+        self.rng = np.random.default_rng()
+
+    def deal(self, catalog, count, exclude=(), ratio=None):
+        """Return up to ``count`` pairs with no row repeated or in ``exclude``.
+
+        Falls back to allowing repeats from earlier rounds once a game has
+        shown nearly the whole catalog; a pair never holds the same row twice.
+        """
+        n = len(catalog)
+        if n < 2:
+            return np.empty((0, 2), dtype=np.intp)
+        seen = set(int(row) for row in exclude)
+        if n - len(seen) < 2:
+            seen = set()
+
+        pairs = []
+        for _ in range(8):
+            size = (count - len(pairs)) * 2 * self.oversample
+            if ratio is None:
+                candidates = self.rng.integers(0, n, size=size).reshape(-1, 2)
+            else:
+                candidates = self._ratio_pairs(catalog, size // 2, ratio)
+            for first, second in candidates.tolist():
+                if first != second and first not in seen and second not in seen:
+                    seen.add(first)
+                    seen.add(second)
+                    pairs.append((first, second))
+                    if len(pairs) == count:
+                        return np.array(pairs, dtype=np.intp)
+            if n - len(seen) < 2:
+                break
+        if len(pairs) < count and n - len(seen) >= 2:
+            # Random draws stop hitting unseen rows late in a long game.
+            pairs.extend(self._unseen_pairs(catalog, count - len(pairs), seen, ratio))
+        if not pairs:
+            pairs = self._unseen_pairs(catalog, count, (), ratio)
+        return np.array(pairs, dtype=np.intp).reshape(-1, 2)
+
+    def _unseen_pairs(self, catalog, count, seen, ratio):
+        """Pair up rows not in ``seen`` directly, in listener order when a ratio is set."""
+        unseen = np.ones(len(catalog), dtype=bool)
+        unseen[list(seen)] = False
+        if ratio is None:
+            rows = self.rng.permutation(np.flatnonzero(unseen))
+            return rows[:2 * min(count, len(rows) // 2)].reshape(-1, 2).tolist()
+        # Neighbours in listener order among the unseen rows are the closest match left.
+        rows = catalog.order[unseen[catalog.order]]
+        offset = int(self.rng.integers(0, 2)) if len(rows) > 2 else 0
+        starts = offset + 2 * self.rng.permutation((len(rows) - offset) // 2)[:count]
+        pairs = np.column_stack((rows[starts], rows[starts + 1]))
+        swap = self.rng.random(len(pairs)) < 0.5
+        pairs[swap] = pairs[swap, ::-1]
+        return pairs.tolist()
+
+    def _ratio_pairs(self, catalog, size, ratio):
+        sorted_listeners = catalog.sorted_listeners
+        n = len(sorted_listeners)
+        anchors = self.rng.integers(0, n, size=size)
+        listeners = catalog.listeners[anchors]
+        # Integer bounds: float keys would make searchsorted cast the whole array.
+        low = np.ceil(listeners / ratio).astype(np.int64)
+        high = np.minimum(np.floor(listeners * ratio), np.iinfo(np.int64).max // 2).astype(np.int64)
+        lo = np.searchsorted(sorted_listeners, low, side='left')
+        hi = np.searchsorted(sorted_listeners, high, side='right')
+        # Nobody else within the ratio: use whichever neighbour in listener order is closer.
+        position = np.searchsorted(sorted_listeners, listeners, side='left')
+        below = np.maximum(position - 1, 0)
+        above = np.minimum(position + 1, n - 1)
+        above_closer = sorted_listeners[above] - listeners <= listeners - sorted_listeners[below]
+        neighbour = np.where(
+            position == 0, above,
+            np.where(position == n - 1, below, np.where(above_closer, above, below)),
+        )
+        span = hi - lo
+        partners = np.where(
+            span > 1,
+            lo + (self.rng.random(size) * span).astype(np.intp),
+            neighbour,
+        )
+        pairs = np.column_stack((anchors, catalog.order[partners]))
+        # Don't always show the anchor on the left.
+        swap = self.rng.random(size) < 0.5
+        pairs[swap] = pairs[swap, ::-1]
+        return pairs
+
+
+generator = RoundGenerator()
+
+# Forked workers would otherwise all deal the same sequence of pairs.
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=generator.reseed)
@@ -0,0 +1,101 @@
+"""Pre-forking production server.
+
+    python serve.py --workers 4 --port 8000
+
+The parent imports the app once, which loads the catalog and memory-maps its
+snapshot, binds the listening socket and forks the workers. Every worker
+accepts on the shared socket and serves requests one at a time, with the
+debugger off. Sessions default to the SQLite store so a game can move
+between workers from one request to the next.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+os.environ.setdefault('SESSION_BACKEND', 'sqlite')
+
+
+def run_worker(app, sock, host, port):
+    from werkzeug.serving import make_server
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server = make_server(host, port, app, fd=sock.fileno())
+    try:
+        server.serve_forever()
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        finish_background_work()
+        os._exit(0)
+
+
+def finish_background_work():
+    """Do what atexit would have: os._exit skips it, and it would run the parent's handlers too."""
+    import app
+
+    app.leaderboard_cache.flush()
+    app.rebuild_executor.shutdown(wait=True)
+
+
+def spawn(app, sock, host, port):
+    pid = os.fork()
+    if pid == 0:
+        run_worker(app, sock, host, port)
+    return pid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--access-log', action='store_true', help="log every request (slow under load)")
+    args = parser.parse_args(argv)
+
+    if not args.access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    from app import app
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+
+    workers = {spawn(app, sock, args.host, args.port) for _ in range(args.workers)}
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers", flush=True)
+
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            # Replace a crashed worker, but don't spin if they die on start.
+            time.sleep(0.5)
+            workers.add(spawn(app, sock, args.host, args.port))
+    sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import pickle
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.sessions import SecureCookieSession, SessionInterface
+
+import metrics
+
+
+class ServerSideSession(SecureCookieSession):
+    """Session dict whose contents stay on the server; the cookie is just ``sid``."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        super().__init__(initial)
+        self.sid = sid
+        self.new = new
+
+
+class MemoryStore:
+    """In-process store. Fast, but every worker process has its own copy."""
+
+    def __init__(self, sweep_every=1000):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._sweep_every = sweep_every
+        self._writes = 0
+
+    def get(self, sid):
+        entry = self._entries.get(sid)
+        if entry is None:
+            return None
+        expires, data = entry
+        if expires < time.time():
+            self.delete(sid)
+            return None
+        return data
+
+    def set(self, sid, data, ttl):
+        with self._lock:
+            self._entries[sid] = (time.time() + ttl, data)
+            self._writes += 1
+            if self._writes % self._sweep_every == 0:
+                self._sweep()
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def _sweep(self):
+        now = time.time()
+        expired = [sid for sid, (expires, _) in self._entries.items() if expires < now]
+        for sid in expired:
+            del self._entries[sid]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteStore:
+    """SQLite-backed store, shared by every process that opens the same file."""
+
+    def __init__(self, path, sweep_every=1000):
+        self.path = path
+        self._local = threading.local()
+        self._sweep_every = sweep_every
+        self._writes = 0
+        # Set up with a throwaway connection so nothing open is inherited across fork().
+        conn = sqlite3.connect(self.path, timeout=10)
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(sid TEXT PRIMARY KEY, expires REAL NOT NULL, data BLOB NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+        conn.close()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires >= ?", (sid, time.time())
+        ).fetchone()
+        return None if row is None else pickle.loads(row[0])
+
+    def set(self, sid, data, ttl):
+        blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        with metrics.timer('session_write'), self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (sid, expires, data) VALUES (?, ?, ?)",
+                (sid, time.time() + ttl, blob),
+            )
+            self._writes += 1
+            if self._writes % self._sweep_every == 0:
+                conn.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+
+    def delete(self, sid):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+
+def make_store(backend, path=None):
+    if backend == 'memory':
+        return MemoryStore()
+    if backend == 'sqlite':
+        return SqliteStore(path)
+    raise ValueError(f"Unknown session backend: {backend!r}")
+
+
+class ServerSideSessionInterface(SessionInterface):
+    session_class = ServerSideSession
+
+    def __init__(self, store, ttl):
+        self.store = store
+        self.ttl = ttl
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.get(sid)
+            if data is not None:
+                return self.session_class(data, sid=sid)
+        return self.session_class(sid=secrets.token_urlsafe(24), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified:
+            self.store.set(session.sid, dict(session), self.ttl)
+
+        # The id never changes, so the cookie only needs sending once.
+        if session.new:
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
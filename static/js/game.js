@@ -0,0 +1,64 @@
+function toggleSettings() {
+    document.getElementById('settings-menu').classList.toggle('open');
+}
+
+function setGradient(gradient) {
+    const gradients = {
+        purple: ['#2c0735', '#6a0dad', '#9b30a8'],
+        red: ['#d32f2f', '#9a1b1b', '#c2185b'],
+        blue: ['#004a80', '#006bb3', '#003d73']
+    };
+    const g = gradients[gradient];
+    document.documentElement.style.setProperty('--gradient-1', g[0]);
+    document.documentElement.style.setProperty('--gradient-2', g[1]);
+    document.documentElement.style.setProperty('--gradient-3', g[2]);
+    localStorage.setItem('gradient', gradient);
+}
+
+window.onload = function() {
+    const saved = localStorage.getItem('gradient');
+    if (saved) setGradient(saved);
+};
+
+// Play rounds through the JSON API and swap the pair in place; if anything
+// goes wrong, fall back to a normal form post.
+(function() {
+    const options = document.querySelector('.game-options');
+    if (!options || !window.fetch) return;
+    const forms = options.querySelectorAll('form');
+    let busy = false;
+
+    function showPair(artists) {
+        forms.forEach(function(form, i) {
+            form.elements.chosen.value = artists[i];
+            form.elements.other.value = artists[1 - i];
+            form.querySelector('.artist-btn').textContent = artists[i];
+        });
+    }
+
+    forms.forEach(function(form) {
+        form.addEventListener('submit', function(event) {
+            event.preventDefault();
+            if (busy) return;
+            busy = true;
+            fetch(options.dataset.api, {
+                method: 'POST',
+                body: new URLSearchParams(new FormData(form)),
+                credentials: 'same-origin'
+            })
+                .then(function(response) { return response.json(); })
+                .then(function(data) {
+                    if (data.result === 'win') {
+                        showPair(data.artists);
+                        document.getElementById('score').textContent = data.score;
+                        busy = false;
+                    } else if (data.result === 'game_over') {
+                        window.location = data.redirect;
+                    } else {
+                        form.submit();
+                    }
+                })
+                .catch(function() { form.submit(); });
+        });
+    });
+})();
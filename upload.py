@@ -0,0 +1,133 @@
+import codecs
+import csv
+import os
+from array import array
+
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+CHUNK_SIZE = 64 * 1024
+REQUIRED_COLUMNS = ("Artist", "MonthlyListeners")
+
+
+class UploadError(ValueError):
+    pass
+
+
+def iter_file_chunks(stream, content_type, field='file', chunk_size=CHUNK_SIZE):
+    """Yield the bytes of one multipart file field as they arrive on ``stream``."""
+    mimetype, options = parse_options_header(content_type)
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise UploadError("Expected a multipart/form-data upload.")
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    in_file = found = False
+    try:
+        while True:
+            event = decoder.next_event()
+            if isinstance(event, NeedData):
+                if decoder.complete:
+                    break
+                decoder.receive_data(stream.read(chunk_size) or None)
+            elif isinstance(event, File):
+                in_file = event.name == field
+                found = found or in_file
+            elif isinstance(event, Data):
+                if in_file and event.data:
+                    yield event.data
+            elif isinstance(event, Epilogue):
+                break
+            else:
+                in_file = False
+    except ClientDisconnected:
+        raise UploadError("The upload was cut off before it finished.")
+    except ValueError:
+        # The decoder's way of saying the body is malformed or truncated.
+        raise UploadError("The upload is not valid multipart/form-data.")
+    if not found:
+        raise UploadError(f"No '{field}' file in the upload.")
+
+
+def iter_lines(chunks):
+    """Decode UTF-8 chunks into text lines, keeping line endings for csv."""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    try:
+        for chunk in chunks:
+            pending += decoder.decode(chunk)
+            # Anything after the last newline may be cut off by the chunk boundary.
+            cut = pending.rfind('\n') + 1
+            if cut:
+                block, pending = pending[:cut - 1], pending[cut:]
+                for line in block.split('\n'):
+                    yield line + '\n'
+        pending += decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        raise UploadError("The file is not valid UTF-8.")
+    if pending:
+        yield pending
+
+
+def _parse_listeners(value):
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        if not number.is_integer():
+            raise
+        return int(number)
+
+
+def read_rows(lines):
+    """Validate CSV lines one row at a time into compact columns.
+
+    Returns ``(names, listeners)`` with listeners packed in an ``array('q')``.
+    Raises UploadError on the first bad row, before anything is published.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        raise UploadError("The file is empty.")
+    header = [column.strip() for column in header]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise UploadError(f"Missing column(s): {', '.join(missing)}.")
+    artist_col = header.index("Artist")
+    listeners_col = header.index("MonthlyListeners")
+
+    names = []
+    listeners = array('q')
+    for row in reader:
+        if not row:
+            continue
+        line = reader.line_num
+        try:
+            name = row[artist_col].strip()
+            count = _parse_listeners(row[listeners_col])
+        except (IndexError, ValueError, OverflowError):
+            raise UploadError(f"Line {line}: expected an artist name and a whole number of listeners.")
+        if not name:
+            raise UploadError(f"Line {line}: artist name is empty.")
+        if not 0 <= count < 2 ** 63:
+            raise UploadError(f"Line {line}: listener count is out of range.")
+        names.append(name)
+        listeners.append(count)
+
+    # The catalog keeps one row per name, so duplicates don't count.
+    if all(name == names[0] for name in names):
+        raise UploadError("The file needs at least two different artists.")
+    return names, listeners
+
+
+def write_csv(path, catalog):
+    """Persist a catalog as the canonical CSV, replacing ``path`` atomically."""
+    # Per process: each prefork worker has its own rebuild executor.
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(REQUIRED_COLUMNS)
+        writer.writerows(zip(catalog.names, catalog.listeners.tolist()))
+    os.replace(tmp_path, path)